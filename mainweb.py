@@ -1,8 +1,11 @@
 import concurrent.futures
 import json
+import multiprocessing
 import os
 import re
 import smtplib
+import tempfile
+import threading
 import zipfile
 from datetime import datetime
 from email.message import EmailMessage
@@ -11,14 +14,16 @@ from io import BytesIO
 import requests
 import streamlit as st
 from PIL import Image
-from PyPDF2 import PdfMerger
+from PyPDF2 import PdfReader, PdfWriter
 from reportlab.lib.colors import white
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
+from reportlab.lib.utils import ImageReader, simpleSplit
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
+from paper_index import analyse_paper, tokenize_text
+
 
 st.set_page_config(page_title="GMAK Paper Port", layout="wide")
 
@@ -40,6 +45,11 @@ DATA_FILE = "data.json"
 REQUESTS_FILE = "custom_school_requests.json"
 DEFAULT_FONT_PATH = "Poppins-Bold.ttf"
 GENERAL_COVER_PATH = "template_base.png"
+END_PAGE_PATH = "end.pdf"
+COVER_CACHE_ENTRIES = 32
+INDEX_WORKERS = 2
+TOPIC_INDEX_FILE = os.path.join(DOWNLOAD_DIR, "topic_index.json")
+PAGE_HASHES_FILE = os.path.join(DOWNLOAD_DIR, "page_hashes.json")
 
 SESSION_OPTIONS = {
     "FEB/MAR": "m",
@@ -47,6 +57,8 @@ SESSION_OPTIONS = {
     "OCT/NOV": "w",
 }
 
+PACK_MODE_OPTIONS = ["Whole Papers", "Topic Pages"]
+
 PAPER_TYPE_OPTIONS = {
     "Question Paper": "qp",
     "Mark Scheme": "ms",
@@ -100,8 +112,11 @@ def ensure_json_file(path, default_content):
             json.dump(default_content, f, indent=4)
 
 
+os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 ensure_json_file(DATA_FILE, {"total_downloads": 0, "logs": []})
 ensure_json_file(REQUESTS_FILE, {"requests": []})
+ensure_json_file(TOPIC_INDEX_FILE, {"papers": {}, "terms": {}})
+ensure_json_file(PAGE_HASHES_FILE, {"papers": {}})
 
 if "public_general_zip_bytes" not in st.session_state:
     st.session_state["public_general_zip_bytes"] = None
@@ -341,7 +356,9 @@ def build_cover_lines(subject_name, paper_type_short, paper_no, level, subject_c
             "ms": "MARK SCHEME",
             "in": "INSERT",
         }
-        paper_line = f"{paper_labels.get(paper_type_short, paper_type_short.upper())} {paper_no}"
+        paper_line = paper_labels.get(paper_type_short, paper_type_short.upper())
+        if paper_no:
+            paper_line = f"{paper_line} {paper_no}"
 
     return heading, subject_name.upper(), paper_line
 
@@ -445,6 +462,28 @@ def _bestexamhelp_url(subject_code, year_suffix, filename):
     )
 
 
+def paper_cache_path(filename):
+    return os.path.join(DOWNLOAD_DIR, filename)
+
+
+@st.cache_resource(show_spinner=False)
+def get_store_lock():
+    # One lock per server process, shared by every session thread.
+    return threading.Lock()
+
+
+def write_file_atomically(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=DOWNLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 def download_paper(args):
     subject_code, session, year_suffix, paper_type_short, paper_no = args
 
@@ -456,6 +495,11 @@ def download_paper(args):
             f"{paper_type_short}_{paper_no}.pdf"
         )
 
+    # Packs are assembled from the cache by path, so a hit never reads the file here.
+    cached_path = paper_cache_path(filename)
+    if os.path.exists(cached_path):
+        return paper_no, filename, cached_path
+
     url = _bestexamhelp_url(
         subject_code,
         year_suffix,
@@ -489,7 +533,8 @@ def download_paper(args):
 
         # Verify it's actually a PDF
         if b"%PDF" in content[:1024]:
-            return paper_no, filename, BytesIO(content)
+            write_file_atomically(cached_path, content)
+            return paper_no, filename, cached_path
 
         print(f"Not a PDF: {url}")
         return paper_no, filename, None
@@ -499,6 +544,290 @@ def download_paper(args):
         print(e)
         return paper_no, filename, None
 
+
+PAPER_FILENAME_PATTERN = re.compile(r"^(\d{4})_([msw])(\d{2})_(qp|ms|in|gt)(?:_(\d+))?\.pdf$")
+SESSION_ORDER = {"m": 0, "s": 1, "w": 2}
+
+
+def parse_paper_filename(filename):
+    match = PAPER_FILENAME_PATTERN.match(filename)
+    if not match:
+        return None
+
+    subject_code, session, year_suffix, paper_type_short, paper_no = match.groups()
+    return {
+        "subject_code": subject_code,
+        "session": session,
+        "year_suffix": year_suffix,
+        "paper_type": paper_type_short,
+        "paper_no": paper_no,
+    }
+
+
+def paper_sort_key(filename):
+    meta = parse_paper_filename(filename) or {}
+    return (
+        meta.get("year_suffix", ""),
+        SESSION_ORDER.get(meta.get("session"), 9),
+        meta.get("paper_no") or "",
+        filename,
+    )
+
+
+def load_topic_index():
+    with open(TOPIC_INDEX_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_topic_index(index):
+    write_file_atomically(TOPIC_INDEX_FILE, json.dumps(index).encode("utf-8"))
+
+
+def load_page_hash_store():
+    with open(PAGE_HASHES_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_page_hash_store(store):
+    write_file_atomically(PAGE_HASHES_FILE, json.dumps(store).encode("utf-8"))
+
+
+def analyse_cached_papers(filenames):
+    # One worker pass per paper feeds both the topic index and the page hashes.
+    with get_store_lock():
+        index = load_topic_index()
+        hash_store = load_page_hash_store()
+
+    pending = []
+    for filename in filenames:
+        path = paper_cache_path(filename)
+        if not os.path.exists(path):
+            continue
+        size = os.path.getsize(path)
+        indexed = index["papers"].get(filename, {}).get("size") == size
+        hashed = hash_store["papers"].get(filename, {}).get("size") == size
+        if not (indexed and hashed):
+            pending.append(path)
+
+    if pending:
+        index, hash_store = _store_paper_analysis(pending)
+
+    page_hashes = {
+        filename: hash_store["papers"][filename]["pages"]
+        for filename in filenames
+        if filename in hash_store["papers"]
+    }
+    return index, page_hashes
+
+
+def _store_paper_analysis(paths):
+    # Spawned workers avoid forking the threaded Streamlit server.
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(INDEX_WORKERS, len(paths)),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        results = [result for result in executor.map(analyse_paper, paths) if result[1] is not None]
+
+    # Re-read under the lock so papers stored by other sessions meanwhile are kept.
+    with get_store_lock():
+        index = load_topic_index()
+        hash_store = load_page_hash_store()
+
+        stale = {filename for filename, _, _ in results if filename in index["papers"]}
+        if stale:
+            for term in list(index["terms"]):
+                postings = index["terms"][term]
+                for filename in stale.intersection(postings):
+                    del postings[filename]
+                if not postings:
+                    del index["terms"][term]
+
+        for filename, pages, hashes in results:
+            size = os.path.getsize(paper_cache_path(filename))
+            entry = parse_paper_filename(filename) or {}
+            entry["pages"] = len(pages)
+            entry["size"] = size
+            index["papers"][filename] = entry
+            hash_store["papers"][filename] = {"size": size, "pages": hashes}
+
+            for page_number, terms in enumerate(pages):
+                for term in terms:
+                    index["terms"].setdefault(term, {}).setdefault(filename, []).append(page_number)
+
+        save_topic_index(index)
+        save_page_hash_store(hash_store)
+
+    return index, hash_store
+
+
+def search_topic_index(index, query, filenames):
+    query_terms = tokenize_text(query)
+    if not query_terms:
+        return {}
+
+    allowed = set(filenames)
+    matches = None
+    for query_term in query_terms:
+        # Prefix matching lets "vector" also pick up "vectors" and "vectorial".
+        hits = {}
+        for term, postings in index["terms"].items():
+            if not term.startswith(query_term):
+                continue
+            for filename in allowed.intersection(postings):
+                hits.setdefault(filename, set()).update(postings[filename])
+
+        if matches is None:
+            matches = hits
+        else:
+            matches = {
+                filename: matches[filename] & pages
+                for filename, pages in hits.items()
+                if filename in matches and matches[filename] & pages
+            }
+
+    return {filename: sorted(pages) for filename, pages in (matches or {}).items() if pages}
+
+
+# Segments are either a file path (cached papers, end page) or PDF bytes
+# (rendered covers). Papers are reused from the DOWNLOAD_DIR cache and opened
+# per pack: PyPDF2 parses lazily, so opening them is cheap.
+def load_paper_segment(filename):
+    path = paper_cache_path(filename)
+    if not os.path.exists(path):
+        return None
+    return path
+
+
+def load_end_segment():
+    if not os.path.exists(END_PAGE_PATH):
+        return None
+    return END_PAGE_PATH
+
+
+@st.cache_data(show_spinner=False, max_entries=COVER_CACHE_ENTRIES)
+def load_cover_segment(level, subject_name, subject_code, paper_type_short, paper_no):
+    # Drawing the cover template is the slow part of a pack, so keep the bytes.
+    cover_pdf = create_public_cover_pdf(level, subject_name, subject_code, paper_type_short, paper_no)
+    if cover_pdf is None:
+        return None
+    return cover_pdf.getvalue()
+
+
+def append_segment(writer, segment, pages=None):
+    if segment is None:
+        return
+
+    reader = PdfReader(BytesIO(segment) if isinstance(segment, bytes) else segment)
+    if pages is None:
+        writer.append(reader)
+    else:
+        for page_number in pages:
+            if page_number < len(reader.pages):
+                writer.add_page(reader.pages[page_number])
+
+
+def assemble_pack(cover_segment, filenames, kept_pages=None):
+    writer = PdfWriter()
+    append_segment(writer, cover_segment)
+    for filename in filenames:
+        pages = kept_pages.get(filename) if kept_pages else None
+        append_segment(writer, load_paper_segment(filename), pages)
+    append_segment(writer, load_end_segment())
+
+    merged_pdf = BytesIO()
+    writer.write(merged_pdf)
+    writer.close()
+    merged_pdf.seek(0)
+    return merged_pdf
+
+
+def plan_page_cleanup(filenames, page_hashes, selected_pages=None):
+    # Drops blank pages and any page already seen earlier in the same pack.
+    # selected_pages limits the plan to the pages a topic pack would include.
+    seen = set()
+    kept_pages = {}
+    pages_removed = 0
+    bytes_saved = 0
+    dropped_xobjects = {}
+    kept_xobjects = set()
+    for filename in filenames:
+        if filename not in page_hashes:
+            continue
+
+        hashes = page_hashes[filename]
+        if selected_pages is None:
+            page_numbers = range(len(hashes))
+        else:
+            page_numbers = [page for page in selected_pages.get(filename, []) if page < len(hashes)]
+
+        kept_pages[filename] = []
+        for page_number in page_numbers:
+            page = hashes[page_number]
+            # Images are written once per source file, so they are keyed by file.
+            xobjects = {(filename, digest): size for digest, size in page.get("xobjects", {}).items()}
+            if page["blank"] or (page["hash"] and page["hash"] in seen):
+                pages_removed += 1
+                bytes_saved += page["bytes"]
+                dropped_xobjects.update(xobjects)
+                continue
+            if page["hash"]:
+                seen.add(page["hash"])
+            kept_xobjects.update(xobjects)
+            kept_pages[filename].append(page_number)
+
+    # An image only leaves the output when no kept page still draws it.
+    bytes_saved += sum(size for key, size in dropped_xobjects.items() if key not in kept_xobjects)
+    return kept_pages, pages_removed, bytes_saved
+
+
+def create_topic_cover_pdf(level, subject_name, subject_code, paper_type_short, topic_query, matches):
+    cover_segment = load_cover_segment(level, subject_name, subject_code, paper_type_short, None)
+    if cover_segment is None:
+        return None
+
+    writer = PdfWriter()
+    append_segment(writer, cover_segment)
+
+    listing = BytesIO()
+    page_width, page_height = A4
+    sources = canvas.Canvas(listing, pagesize=A4)
+    left_margin = 70
+    line_width = page_width - left_margin * 2
+    top_y = page_height - 80
+    line_gap = 18
+
+    def start_listing_page(title):
+        sources.setFillColorRGB(0, 0, 0)
+        sources.setFont(COVER_FONT_NAME, 20)
+        sources.drawString(left_margin, top_y, title[:48])
+        sources.setFont("Helvetica", 11)
+        return top_y - 36
+
+    y = start_listing_page(f"TOPIC: {topic_query.upper()}")
+    sources.drawString(left_margin, y, f"{sum(len(p) for p in matches.values())} pages from {len(matches)} papers")
+    y -= line_gap * 2
+
+    for filename in sorted(matches, key=paper_sort_key):
+        page_list = ", ".join(str(page + 1) for page in matches[filename])
+        for line in simpleSplit(f"{filename}  -  pages {page_list}", "Helvetica", 11, line_width):
+            if y < 60:
+                sources.showPage()
+                y = start_listing_page("SOURCES (CONTINUED)")
+            sources.drawString(left_margin, y, line)
+            y -= line_gap
+
+    sources.showPage()
+    sources.save()
+    listing.seek(0)
+    for page in PdfReader(listing).pages:
+        writer.add_page(page)
+
+    cover_pdf = BytesIO()
+    writer.write(cover_pdf)
+    cover_pdf.seek(0)
+    return cover_pdf
+
+
 def render_home_page():
     logo_col, _ = st.columns([1, 5])
     with logo_col:
@@ -551,7 +880,13 @@ def render_home_page():
     sessions = [SESSION_OPTIONS[label] for label in selected_session_labels]
 
     paper_type = st.selectbox("Paper Type", list(PAPER_TYPE_OPTIONS.keys()))
+    pack_mode = st.radio("Pack Mode", PACK_MODE_OPTIONS, horizontal=True)
+    if pack_mode == "Topic Pages":
+        topic_query = st.text_input("Topic Search (example: vectors)", "")
+    else:
+        topic_query = ""
     paper_type_short = PAPER_TYPE_OPTIONS[paper_type]
+    remove_repeated_pages = st.checkbox("Remove blank and duplicate pages", value=False)
 
     if paper_type_short != "gt":
         paper_input_raw = st.text_input("Enter Paper Numbers (example: 12 22 32)", "12 22 32 42")
@@ -571,6 +906,9 @@ def render_home_page():
         if not sessions:
             st.error("Please select at least one session.")
             return
+        if pack_mode == "Topic Pages" and not tokenize_text(topic_query):
+            st.error("Please enter a topic to search for.")
+            return
         if not os.path.exists(GENERAL_COVER_PATH):
             st.error(f"Cover image not found: {GENERAL_COVER_PATH}")
             return
@@ -599,14 +937,13 @@ def render_home_page():
         with concurrent.futures.ThreadPoolExecutor(max_workers=12) as executor:
             futures = {executor.submit(download_paper, task): task for task in tasks}
             for future in concurrent.futures.as_completed(futures):
-                paper_no, filename, content = future.result()
+                paper_no, filename, cached_path = future.result()
 
-                if content:
-                    content.seek(0)
+                if cached_path:
                     if paper_type_short == "gt":
-                        gt_downloads.append(content)
+                        gt_downloads.append(filename)
                     else:
-                        downloaded_by_number[paper_no].append(content)
+                        downloaded_by_number[paper_no].append(filename)
                     downloaded.append(filename)
                 else:
                     failed.append(filename)
@@ -619,47 +956,82 @@ def render_home_page():
             st.warning("No valid PDFs were downloaded, so no merged files were created.")
             return
 
+        page_hashes = {}
+        if pack_mode == "Topic Pages" or remove_repeated_pages:
+            status_placeholder.caption("Indexing downloaded papers...")
+            topic_index, page_hashes = analyse_cached_papers(downloaded)
+
+        if pack_mode == "Topic Pages":
+            topic_matches = search_topic_index(topic_index, topic_query, downloaded)
+            if not topic_matches:
+                st.warning(f"No pages matched \"{topic_query}\" in the downloaded papers.")
+                return
+            status_placeholder.caption(
+                f"Found {sum(len(p) for p in topic_matches.values())} matching pages "
+                f"in {len(topic_matches)} papers"
+            )
+
+        cleanup_report = []
+
+        def plan_cleanup(pack_name, filenames, selected_pages=None):
+            if not remove_repeated_pages:
+                return None
+            kept_pages, pages_removed, bytes_saved = plan_page_cleanup(
+                filenames, page_hashes, selected_pages
+            )
+            cleanup_report.append(
+                {
+                    "Pack": pack_name,
+                    "Pages removed": pages_removed,
+                    "KB saved": round(bytes_saved / 1024),
+                }
+            )
+            return kept_pages
+
         output_zip = BytesIO()
         with zipfile.ZipFile(output_zip, "w") as zf:
-            if paper_type_short == "gt":
-                merger = PdfMerger()
-                cover_pdf = create_public_cover_pdf(level_choice, subject_name, subject_code, paper_type_short, None)
-                if cover_pdf:
-                    merger.append(cover_pdf)
-                for pdf in gt_downloads:
-                    pdf.seek(0)
-                    merger.append(pdf)
-                merged_pdf = BytesIO()
-                merger.write(merged_pdf)
-                merger.close()
-                merged_pdf.seek(0)
-                zf.writestr(
-                    f"{level_choice}_{subject_code}_Grade_Thresholds_GMAK.pdf",
-                    merged_pdf.getvalue(),
+            if pack_mode == "Topic Pages":
+                topic_slug = "_".join(tokenize_text(topic_query)).title()
+                topic_name = f"{level_choice}_{subject_code}_Topic_{topic_slug}_GMAK.pdf"
+                kept_pages = plan_cleanup(topic_name, sorted(topic_matches, key=paper_sort_key), topic_matches)
+                if kept_pages is not None:
+                    topic_matches = {
+                        filename: [page for page in pages if page in kept_pages.get(filename, pages)]
+                        for filename, pages in topic_matches.items()
+                    }
+                    topic_matches = {filename: pages for filename, pages in topic_matches.items() if pages}
+                cover_pdf = create_topic_cover_pdf(
+                    level_choice, subject_name, subject_code, paper_type_short, topic_query, topic_matches
                 )
+                merged_pdf = assemble_pack(
+                    cover_pdf.getvalue() if cover_pdf else None,
+                    sorted(topic_matches, key=paper_sort_key),
+                    topic_matches,
+                )
+                zf.writestr(topic_name, merged_pdf.getvalue())
+            elif paper_type_short == "gt":
+                pack_name = f"{level_choice}_{subject_code}_Grade_Thresholds_GMAK.pdf"
+                filenames = sorted(gt_downloads, key=paper_sort_key)
+                merged_pdf = assemble_pack(
+                    load_cover_segment(level_choice, subject_name, subject_code, paper_type_short, None),
+                    filenames,
+                    plan_cleanup(pack_name, filenames),
+                )
+                zf.writestr(pack_name, merged_pdf.getvalue())
             else:
                 for num in paper_numbers:
                     pdf_list = downloaded_by_number.get(num, [])
                     if not pdf_list:
                         continue
 
-                    merger = PdfMerger()
-                    cover_pdf = create_public_cover_pdf(
-                        level_choice, subject_name, subject_code, paper_type_short, num
-                    )
-                    if cover_pdf:
-                        merger.append(cover_pdf)
-                    for pdf in pdf_list:
-                        pdf.seek(0)
-                        merger.append(pdf)
-                    merged_pdf = BytesIO()
-                    merger.write(merged_pdf)
-                    merger.close()
-                    merged_pdf.seek(0)
-                    zf.writestr(
-                        f"{level_choice}_{subject_code}_Paper_{num}_GMAK.pdf",
-                        merged_pdf.getvalue(),
+                    pack_name = f"{level_choice}_{subject_code}_Paper_{num}_GMAK.pdf"
+                    filenames = sorted(pdf_list, key=paper_sort_key)
+                    merged_pdf = assemble_pack(
+                        load_cover_segment(level_choice, subject_name, subject_code, paper_type_short, num),
+                        filenames,
+                        plan_cleanup(pack_name, filenames),
                     )
+                    zf.writestr(pack_name, merged_pdf.getvalue())
 
         output_zip.seek(0)
         update_data_log(
@@ -674,6 +1046,9 @@ def render_home_page():
         st.session_state["public_general_zip_bytes"] = output_zip.getvalue()
         st.session_state["public_general_zip_name"] = f"{level_choice}_{subject_code}_gmak_paper_pack.zip"
         st.success(f"Downloaded {len(downloaded)} papers. {len(failed)} failed.")
+        if cleanup_report:
+            st.write("### Pages Removed")
+            st.table(cleanup_report)
 
     if st.session_state["public_general_zip_bytes"]:
         st.write("")
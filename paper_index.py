@@ -0,0 +1,200 @@
+import hashlib
+import os
+import re
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, ContentStream
+
+
+# Kept out of mainweb.py so process pool workers can import it without
+# re-running the Streamlit page.
+
+# CAIE "BLANK PAGE" sheets only carry that label, the UCLES footer and the
+# margin warning that is printed on every page.
+BLANK_PAGE_LABEL = {"blank", "page"}
+BLANK_PAGE_TERMS = BLANK_PAGE_LABEL | {
+    "ucles", "cambridge", "assessment", "international", "education",
+    "not", "write", "this", "margin",
+}
+
+TEXT_SHOWING_OPERATORS = {b"Tj", b"TJ", b"'", b'"'}
+PAINTING_OPERATORS = {
+    b"S", b"s", b"f", b"F", b"f*", b"B", b"B*", b"b", b"b*", b"sh", b"INLINE IMAGE",
+}
+MAX_FORM_DEPTH = 4
+
+
+def tokenize_text(text):
+    return re.findall(r"[a-z]{3,}", text.lower())
+
+
+def _raw_data(stream):
+    # Only used for hashing. PyPDF2 has no public accessor for the encoded
+    # bytes, and decoding every image just to hash it is what we avoid here.
+    stream = stream.get_object()
+    data = getattr(stream, "_data", None)
+    return data if data is not None else stream.get_data()
+
+
+def _raw_length(stream):
+    # The encoded size is what the stream costs in the output file.
+    stream = stream.get_object()
+    length = stream.get("/Length")
+    if length is not None:
+        return int(length.get_object())
+    # PyPDF2 3.x drops /Length once the stream has been read.
+    data = getattr(stream, "_data", None)
+    if data is not None:
+        return len(data)
+    return len(stream.get_data())
+
+
+def _content_length(page):
+    contents = page.get("/Contents")
+    if contents is None:
+        return 0
+    contents = contents.get_object()
+    if isinstance(contents, ArrayObject):
+        return sum(_raw_length(stream) for stream in contents)
+    return _raw_length(contents)
+
+
+def _resource(resources, key):
+    value = resources.get(key) if resources is not None else None
+    return value.get_object() if value is not None else {}
+
+
+def _xobject_digest(xobject, digests):
+    # The same image object is usually shared by many pages, so hash it once.
+    key = getattr(xobject, "idnum", None) or id(xobject.get_object())
+    if key not in digests:
+        digests[key] = hashlib.sha1(_raw_data(xobject)).hexdigest()
+    return digests[key]
+
+
+def _scan_drawing(content, resources, reader, digests, depth=0):
+    shows_text = False
+    paints = False
+    images = set()
+    xobjects = _resource(resources, "/XObject")
+
+    for operands, operator in ContentStream(content, reader).operations:
+        if operator in TEXT_SHOWING_OPERATORS:
+            shows_text = True
+        elif operator in PAINTING_OPERATORS:
+            paints = True
+        elif operator == b"Do" and operands and operands[0] in xobjects:
+            xobject = xobjects[operands[0]]
+            form = xobject.get_object()
+            if form.get("/Subtype") == "/Form":
+                if depth >= MAX_FORM_DEPTH:
+                    paints = True
+                    continue
+                form_resources = form.get("/Resources")
+                form_text, form_paints, form_images = _scan_drawing(
+                    form,
+                    form_resources.get_object() if form_resources is not None else resources,
+                    reader,
+                    digests,
+                    depth + 1,
+                )
+                shows_text = shows_text or form_text
+                paints = paints or form_paints
+                images |= form_images
+            else:
+                images.add(_xobject_digest(xobject, digests))
+
+    return shows_text, paints, images
+
+
+def _page_fingerprint(page, reader, terms, digests):
+    contents = page.get_contents()
+    resources = _resource(page, "/Resources")
+    data = contents.get_data() if contents is not None else b""
+    digest = hashlib.sha1(data)
+
+    # Identical content streams can still draw different fonts or images,
+    # so the resources they point at are part of the hash.
+    fonts = _resource(resources, "/Font")
+    for name, font in sorted(fonts.items()):
+        digest.update(f"{name}={font.get_object().get('/BaseFont')}".encode())
+
+    xobjects = {}
+    for name, xobject in sorted(_resource(resources, "/XObject").items()):
+        xobject_digest = _xobject_digest(xobject, digests)
+        digest.update(f"{name}={xobject_digest}".encode())
+        xobjects[xobject_digest] = _raw_length(xobject)
+
+    if contents is not None:
+        shows_text, paints, images = _scan_drawing(contents, resources, reader, digests)
+    else:
+        shows_text, paints, images = False, False, set()
+
+    return {
+        "hash": digest.hexdigest(),
+        "bytes": _content_length(page),
+        "xobjects": xobjects,
+        "shows_text": shows_text,
+        "paints": paints,
+        "images": sorted(images),
+    }
+
+
+def _is_blank(page, terms, furniture):
+    # A labelled BLANK PAGE sheet is blank whatever else it draws: CAIE adds
+    # per-page barcodes, margin rules and the like to every sheet.
+    if BLANK_PAGE_LABEL <= terms <= BLANK_PAGE_TERMS:
+        return True
+
+    # Unlabelled pages need to draw nothing beyond boilerplate text and
+    # images repeated on every page, so answer grids and diagrams are kept.
+    if page["paints"] or set(page["images"]) - furniture:
+        return False
+    return not page["shows_text"] or bool(terms) and terms <= BLANK_PAGE_TERMS
+
+
+def analyse_paper(path):
+    try:
+        reader = PdfReader(path)
+        pages = []
+        fingerprints = []
+        digests = {}
+        for page in reader.pages:
+            try:
+                text = page.extract_text() or ""
+            except Exception:
+                text = ""
+            terms = sorted(set(tokenize_text(text)))
+            pages.append(terms)
+
+            try:
+                fingerprints.append(_page_fingerprint(page, reader, terms, digests))
+            except Exception as e:
+                print(f"Page fingerprint failed: {path}")
+                print(e)
+                fingerprints.append(None)
+
+        # A logo drawn on every page is furniture, not content.
+        drawn = [set(page["images"]) for page in fingerprints if page]
+        furniture = set.intersection(*drawn) if len(drawn) > 1 else set()
+
+        hashes = []
+        for page_number, page in enumerate(fingerprints):
+            if page is None:
+                hashes.append({"hash": None, "blank": False, "bytes": 0, "xobjects": {}})
+                continue
+            blank = _is_blank(page, set(pages[page_number]), furniture)
+            hashes.append(
+                {
+                    "hash": page["hash"],
+                    "blank": blank,
+                    "bytes": page["bytes"],
+                    "xobjects": page["xobjects"],
+                }
+            )
+
+        return os.path.basename(path), pages, hashes
+    except Exception as e:
+        print(f"Indexing failed: {path}")
+        print(e)
+        return os.path.basename(path), None, None
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from paper_index import analyse_paper
+
+
+FOOTER = "© UCLES 2019 9709/12/M/J/19"
+
+
+def draw_barcode(c, seed):
+    rng = random.Random(seed)
+    x = 500
+    for _ in range(20):
+        width = rng.choice([1, 2, 3])
+        c.rect(x, 790, width, 30, stroke=0, fill=1)
+        x += width + rng.choice([1, 2])
+
+
+def draw_rule(c, seed):
+    c.line(50, 55, 545, 55)
+
+
+def draw_margin_label(c, seed):
+    c.drawString(560, 400, "DO NOT WRITE IN THIS MARGIN")
+
+
+def draw_nothing(c, seed):
+    pass
+
+
+@pytest.mark.parametrize("furniture", [draw_barcode, draw_rule, draw_margin_label, draw_nothing])
+def test_labelled_blank_page_is_blank_despite_page_furniture(tmp_path, furniture):
+    path = tmp_path / "9709_s19_qp_12.pdf"
+    c = canvas.Canvas(str(path), pagesize=A4)
+    for page_number, body in enumerate(["1 Find the vectors AB and AC.", "2 Solve the equation.", "BLANK PAGE"]):
+        c.setFont("Helvetica", 11)
+        furniture(c, page_number)
+        c.drawString(250 if body == "BLANK PAGE" else 50, 420 if body == "BLANK PAGE" else 700, body)
+        c.drawString(50, 40, FOOTER)
+        c.showPage()
+    c.save()
+
+    _, _, hashes = analyse_paper(str(path))
+
+    assert [page["blank"] for page in hashes] == [False, False, True]
+
+
+def test_unlabelled_drawing_and_symbols_are_kept(tmp_path):
+    path = tmp_path / "9709_s19_qp_12.pdf"
+    c = canvas.Canvas(str(path), pagesize=A4)
+    c.line(50, 400, 300, 600)
+    c.showPage()
+    c.setFont("Helvetica", 11)
+    c.drawString(50, 700, "x = 3 + y")
+    c.showPage()
+    c.setFont("Helvetica", 11)
+    c.showPage()
+    c.save()
+
+    _, _, hashes = analyse_paper(str(path))
+
+    assert [page["blank"] for page in hashes] == [False, False, True]
+    assert all(page["bytes"] > 0 for page in hashes)